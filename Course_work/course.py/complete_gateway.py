@@ -1,20 +1,47 @@
 from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
+import orjson
 import asyncio
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import time
+import re
+import itertools
+import heapq
 import logging
+import queue
+import atexit
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict
+from urllib.parse import urlencode
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Log-երը request-ի ընթացքում միայն հերթագրվում են, stderr-ում գրում է առանձին thread-ը
+_log_queue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(
+    logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 )
+log_listener = QueueListener(_log_queue, _log_stream_handler)
+
+# QueueHandler-ի default formatter-ը թողնում է միայն message-ը, prefix-ը ավելացնում է listener-ը
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(QueueHandler(_log_queue))
+# Listener-ը սկսվում է handler-ի հետ միասին, որ lifespan-ից դուրս log-երը չկուտակվեն հերթում
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
+# Header-ներ, որոնք չպետք է փոխանցվեն backend-ին (Starlette-ի raw key-երը արդեն lowercase են)
+HOP_BY_HOP_HEADERS = frozenset({b'host', b'connection', b'transfer-encoding'})
+
+# Request ID-ների հաշվիչ, եզակի է process-ի ներսում
+_request_counter = itertools.count(1)
+
 
 class GatewayConfig:
     SERVICES = {
@@ -49,70 +76,120 @@ class GatewayConfig:
     
     CIRCUIT_BREAKER = {
         'failure_threshold': 5,
-        'timeout': 60,
-        'half_open_timeout': 30
+        'base_timeout': 0.5,  # առաջին OPEN-ի cooldown-ը, կրկնապատկվում է ամեն ցիկլում
+        'timeout': 60,  # cooldown-ի վերին սահման
+        'half_open_timeout': 30,
+        'half_open_max_probes': 1
     }
 
 
+# Փոփոխություն չունեցող error body-ները serialize արվում են մեկ անգամ
+RATE_LIMITED_BODY = orjson.dumps({"error": "Rate limit exceeded", "retry_after": 60})
+SERVICE_UNAVAILABLE_BODIES = {
+    service_name: orjson.dumps({
+        "error": "Service temporarily unavailable",
+        "service": service_name
+    })
+    for service_name in GatewayConfig.SERVICES
+}
+
+
+@dataclass(slots=True)
+class CBState:
+    """Մեկ ծառայության circuit breaker-ի վիճակը"""
+    state: str = 'closed'  # closed, open, half-open
+    failures: int = 0
+    last_failure_time: float = 0.0
+    success_count: int = 0
+    open_cycles: int = 0
+    current_timeout: float = 0.0
+    probes: int = 0  # half-open-ում ընթացքի մեջ գտնվող փորձնական request-ներ
+    generation: int = 0  # ավելանում է ամեն HALF-OPEN անցման ժամանակ, նշում է ընթացիկ probe-երը
+
+
 class InMemoryStorage:
+    # Hot path-ի counter-ները slot attribute-ներ են՝ dict lookup-ի փոխարեն
+    __slots__ = (
+        'rate_limits', 'circuit_breakers', 'cache', 'max_cache_entries', 'inflight',
+        '_expirations', 'total_requests', 'successful_requests', 'failed_requests',
+        'cached_requests'
+    )
     
-    def __init__(self):
-        self.rate_limits: Dict[str, Dict] = {}
+    def __init__(self, max_cache_entries: int = 10000):
+        # user_id -> (prev_count, curr_count, window_start)
+        self.rate_limits: Dict[str, tuple] = {}
+        
+        self.circuit_breakers: Dict[str, CBState] = {}
         
-        self.circuit_breakers: Dict[str, Dict] = {}
+        # LRU հերթականությամբ՝ ամենահին օգտագործվածը սկզբում
+        self.cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self.max_cache_entries = max_cache_entries
         
-        self.cache: Dict[str, Dict[str, Any]] = {}
+        # cache_key -> Future, որպեսզի նույն key-ի զուգահեռ miss-երը անեն մեկ backend request
+        self.inflight: Dict[str, asyncio.Future] = {}
         
-        self.stats = {
-            'total_requests': 0,
-            'successful_requests': 0,
-            'failed_requests': 0,
-            'cached_requests': 0
+        # (expires_at, key) min-heap, որպեսզի sweep-ը անցնի միայն ժամկետանցների վրայով
+        self._expirations: list = []
+        
+        self.total_requests = 0
+        self.successful_requests = 0
+        self.failed_requests = 0
+        self.cached_requests = 0
+    
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Counter-ները dict-ի տեսքով (metrics-ի համար)"""
+        return {
+            'total_requests': self.total_requests,
+            'successful_requests': self.successful_requests,
+            'failed_requests': self.failed_requests,
+            'cached_requests': self.cached_requests
         }
     
-    def get_rate_limit_data(self, key: str) -> Dict:
-        current_time = time.time()
+    def check_rate_limit(self, key: str, limit: int, now: float, window: int = 60) -> bool:
+        """Sliding window counter: ստուգել և ավելացնել counter-ը"""
+        # Read-modify-write-ի միջև await չկա, ուստի event loop-ում այն ատոմար է
+        # և lock պետք չէ, նույնիսկ նույն user-ի զուգահեռ request-ների դեպքում
+        prev_count, curr_count, window_start = self.rate_limits.get(key, (0, 0, now))
         
-        if key not in self.rate_limits:
-            self.rate_limits[key] = {
-                'count': 0,
-                'reset_time': current_time + 60
-            }
-        
-        data = self.rate_limits[key]
+        age = now - window_start
+        if age >= window:
+            # Եթե մեկից ավելի window է անցել, նախորդը նույնպես դատարկ է
+            prev_count = curr_count if age < 2 * window else 0
+            curr_count = 0
+            window_start += window * (age // window)
+            age = now - window_start
         
-        # Reset եթե ժամանակը անցել է
-        if current_time > data['reset_time']:
-            data['count'] = 0
-            data['reset_time'] = current_time + 60
+        # Նախորդ window-ի մասնաբաժինը, որը դեռ ընկնում է վերջին 60 վայրկյանում
+        if prev_count * (1 - age / window) + curr_count >= limit:
+            self.rate_limits[key] = (prev_count, curr_count, window_start)
+            return False
         
-        return data
-    
-    def increment_rate_limit(self, key: str) -> int:
-        """Ավելացնել rate limit counter-ը"""
-        data = self.get_rate_limit_data(key)
-        data['count'] += 1
-        return data['count']
+        self.rate_limits[key] = (prev_count, curr_count + 1, window_start)
+        return True
     
-    def get_circuit_breaker_state(self, service: str) -> Dict:
+    def get_circuit_breaker_state(self, service: str) -> CBState:
         """Circuit breaker վիճակ"""
-        if service not in self.circuit_breakers:
-            self.circuit_breakers[service] = {
-                'state': 'closed',  # closed, open, half-open
-                'failures': 0,
-                'last_failure_time': 0,
-                'success_count': 0
-            }
-        return self.circuit_breakers[service]
+        cb_state = self.circuit_breakers.get(service)
+        if cb_state is None:
+            cb_state = self.circuit_breakers[service] = CBState()
+        return cb_state
     
-    def cache_set(self, key: str, value: Any, ttl: int = 300):
+    def cache_set(self, key: str, value: Any, now: float, ttl: int = 300):
         """Cache-ավորել արժեքը"""
+        expires_at = now + ttl
         self.cache[key] = {
             'value': value,
-            'expires_at': time.time() + ttl
+            'expires_at': expires_at
         }
+        self.cache.move_to_end(key)
+        
+        if len(self.cache) > self.max_cache_entries:
+            self.cache.popitem(last=False)
+        
+        heapq.heappush(self._expirations, (expires_at, key))
     
-    def cache_get(self, key: str) -> Optional[Any]:
+    def cache_get(self, key: str, now: float) -> Optional[Any]:
         """Վերադարձնել cache-ից"""
         if key not in self.cache:
             return None
@@ -120,11 +197,33 @@ class InMemoryStorage:
         cached = self.cache[key]
         
         # Ստուգել TTL-ը
-        if time.time() > cached['expires_at']:
+        if now > cached['expires_at']:
             del self.cache[key]
             return None
         
+        self.cache.move_to_end(key)
         return cached['value']
+    
+    def evict_expired(self) -> int:
+        """Ջնջել ժամկետանց cache գրառումները"""
+        current_time = time.monotonic()
+        evicted = 0
+        
+        while self._expirations and self._expirations[0][0] <= current_time:
+            _, key = heapq.heappop(self._expirations)
+            cached = self.cache.get(key)
+            # Key-ը կարող էր վերագրվել ավելի ուշ expires_at-ով
+            if cached is not None and cached['expires_at'] <= current_time:
+                del self.cache[key]
+                evicted += 1
+        
+        return evicted
+    
+    async def sweep_expired(self, interval: float = 1.0):
+        """Background task, որը պարբերաբար մաքրում է cache-ը"""
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_expired()
 
 
 class APIGateway:
@@ -133,120 +232,212 @@ class APIGateway:
     def __init__(self, config: GatewayConfig, storage: InMemoryStorage):
         self.config = config
         self.storage = storage
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+        
+        # Առանձին client (և connection pool) յուրաքանչյուր backend-ի համար,
+        # որպեսզի դանդաղ ծառայությունը չզբաղեցնի մյուսների connection-ները
+        self.clients: Dict[str, httpx.AsyncClient] = {
+            name: httpx.AsyncClient(
+                base_url=service_config['url'],
+                http2=True,
+                limits=httpx.Limits(
+                    max_keepalive_connections=100,
+                    max_connections=200,
+                    keepalive_expiry=30.0
+                ),
+                timeout=httpx.Timeout(service_config['timeout'], connect=5.0, pool=5.0)
+            )
+            for name, service_config in config.SERVICES.items()
+        }
+        
+        # Բոլոր prefix-ները մեկ regex-ում, ամենաերկարը առաջինը (longest-prefix match)
+        prefixes = sorted(config.ROUTES, key=len, reverse=True)
+        self._route_re = re.compile(
+            '(' + '|'.join(re.escape(prefix) for prefix in prefixes) + ')(?=/|$)'
+        )
         logger.info("Gateway initialized")
 
     def find_service(self, path: str) -> Optional[str]:
         """Գտնել ծառայությունը path-ի հիման վրա"""
-        for route_prefix, service_name in self.config.ROUTES.items():
-            if path.startswith(route_prefix):
-                return service_name
-        return None
+        match = self._route_re.match(path)
+        return self.config.ROUTES[match.group(1)] if match else None
     
-    def check_rate_limit(self, user_id: str, tier: str = 'default') -> bool:
+    def check_rate_limit(self, user_id: str, now: float, tier: str = 'default') -> bool:
         """Ստուգել rate limit-ը"""
         limit = self.config.RATE_LIMITS.get(tier, self.config.RATE_LIMITS['default'])
-        count = self.storage.increment_rate_limit(user_id)
         
-        if count > limit:
-            logger.warning(f"Rate limit exceeded for {user_id}: {count}/{limit}")
+        if not self.storage.check_rate_limit(user_id, limit, now):
+            logger.warning("Rate limit exceeded for %s: %s/min", user_id, limit)
             return False
         
         return True
     
-    def check_circuit_breaker(self, service_name: str) -> bool:
-        """Ստուգել circuit breaker-ը"""
+    def check_circuit_breaker(self, service_name: str, now: float) -> Tuple[bool, int]:
+        """Ստուգել circuit breaker-ը
+
+        Վերադարձնում է (allowed, probe_generation), որտեղ probe_generation-ը 0 է
+        սովորական request-ների համար և half-open generation-ը՝ probe-երի համար։
+        """
         cb_state = self.storage.get_circuit_breaker_state(service_name)
-        current_time = time.time()
         
-        if cb_state['state'] == 'open':
+        if cb_state.state == 'open':
             # Փորձել անցնել half-open-ի
-            time_since_open = current_time - cb_state['last_failure_time']
-            if time_since_open > self.config.CIRCUIT_BREAKER['timeout']:
-                cb_state['state'] = 'half-open'
-                cb_state['success_count'] = 0
-                logger.info(f"Circuit breaker for {service_name}: OPEN -> HALF-OPEN")
-                return True
+            time_since_open = now - cb_state.last_failure_time
+            if time_since_open > cb_state.current_timeout:
+                self._enter_half_open(cb_state)
+                cb_state.probes = 1
+                logger.info("Circuit breaker for %s: OPEN -> HALF-OPEN", service_name)
+                return True, cb_state.generation
             
-            logger.warning(f"Circuit breaker OPEN for {service_name}")
-            return False
+            logger.warning("Circuit breaker OPEN for %s", service_name)
+            return False, 0
         
-        return True
+        if cb_state.state == 'half-open':
+            # Թույլ տալ միայն սահմանափակ թվով probe-եր, մնացածը՝ fast-fail
+            if cb_state.probes >= self.config.CIRCUIT_BREAKER['half_open_max_probes']:
+                logger.warning("Circuit breaker HALF-OPEN for %s: probe in flight", service_name)
+                return False, 0
+            cb_state.probes += 1
+            return True, cb_state.generation
+        
+        return True, 0
+    
+    def _cooldown(self, open_cycles: int) -> float:
+        """OPEN վիճակի տևողությունը՝ exponential backoff-ով"""
+        cb_config = self.config.CIRCUIT_BREAKER
+        return min(cb_config['timeout'], cb_config['base_timeout'] * 2 ** open_cycles)
+    
+    def _enter_half_open(self, cb_state: CBState):
+        """Անցնել HALF-OPEN՝ նոր probe generation-ով"""
+        cb_state.state = 'half-open'
+        cb_state.success_count = 0
+        cb_state.probes = 0
+        cb_state.generation += 1
+    
+    def _is_current_probe(self, cb_state: CBState, probe_generation: int) -> bool:
+        """Արդյոք request-ը ընթացիկ half-open ցիկլի probe է"""
+        return cb_state.state == 'half-open' and probe_generation == cb_state.generation
+    
+    def release_probe(self, service_name: str, probe_generation: int):
+        """Ազատել չավարտված probe-ի տեղը՝ առանց այն հաշվելու success կամ failure"""
+        cb_state = self.storage.get_circuit_breaker_state(service_name)
+        if self._is_current_probe(cb_state, probe_generation):
+            cb_state.probes -= 1
     
-    def record_success(self, service_name: str):
+    def record_success(self, service_name: str, probe_generation: int = 0):
         """Գրանցել հաջող request-ը"""
         cb_state = self.storage.get_circuit_breaker_state(service_name)
         
-        if cb_state['state'] == 'half-open':
-            cb_state['success_count'] += 1
-            if cb_state['success_count'] >= 2:
-                cb_state['state'] = 'closed'
-                cb_state['failures'] = 0
-                logger.info(f"Circuit breaker for {service_name}: HALF-OPEN -> CLOSED")
-        else:
-            cb_state['failures'] = 0
+        if self._is_current_probe(cb_state, probe_generation):
+            cb_state.probes -= 1
+            cb_state.success_count += 1
+            if cb_state.success_count >= 2:
+                cb_state.state = 'closed'
+                cb_state.failures = 0
+                cb_state.open_cycles = 0
+                logger.info("Circuit breaker for %s: HALF-OPEN -> CLOSED", service_name)
+        elif cb_state.state == 'closed':
+            cb_state.failures = 0
         
-        self.storage.stats['successful_requests'] += 1
+        self.storage.successful_requests += 1
     
-    def record_failure(self, service_name: str):
+    def record_failure(self, service_name: str, probe_generation: int = 0):
         """Գրանցել ձախողված request-ը"""
         cb_state = self.storage.get_circuit_breaker_state(service_name)
-        cb_state['failures'] += 1
-        cb_state['last_failure_time'] = time.time()
-        
-        if cb_state['state'] == 'half-open':
-            # Half-open-ում ցանկացած failure-ը բացում է circuit-ը
-            cb_state['state'] = 'open'
-            logger.warning(f"Circuit breaker for {service_name}: HALF-OPEN -> OPEN")
-        elif cb_state['failures'] >= self.config.CIRCUIT_BREAKER['failure_threshold']:
-            cb_state['state'] = 'open'
-            logger.warning(f"Circuit breaker for {service_name}: CLOSED -> OPEN")
-        
-        self.storage.stats['failed_requests'] += 1
+        self.storage.failed_requests += 1
+        
+        if cb_state.state == 'half-open' and not self._is_current_probe(cb_state, probe_generation):
+            # Half-open-ից առաջ սկսված request-ը չի ազդում probe-երի հաշվարկի վրա
+            return
+        
+        cb_state.failures += 1
+        # Failure-ը գրանցվում է backend-ի պատասխանից հետո, ուստի ժամանակը թարմ է վերցվում
+        cb_state.last_failure_time = time.monotonic()
+        
+        if cb_state.state == 'half-open':
+            # Half-open-ում probe-ի failure-ը բացում է circuit-ը
+            cb_state.probes -= 1
+            cb_state.state = 'open'
+            cb_state.open_cycles += 1
+            cb_state.current_timeout = self._cooldown(cb_state.open_cycles)
+            logger.warning(
+                "Circuit breaker for %s: HALF-OPEN -> OPEN (retry in %ss)",
+                service_name, cb_state.current_timeout
+            )
+        elif cb_state.failures >= self.config.CIRCUIT_BREAKER['failure_threshold']:
+            cb_state.state = 'open'
+            cb_state.current_timeout = self._cooldown(cb_state.open_cycles)
+            logger.warning("Circuit breaker for %s: CLOSED -> OPEN", service_name)
     
     async def forward_request(
         self,
         service_name: str,
         path: str,
         method: str,
-        headers: dict,
+        headers: List[Tuple[bytes, bytes]],
         body: bytes = None,
-        params: dict = None
+        query: str = None,
+        probe_generation: int = 0
     ) -> httpx.Response:
         """Forward անել request-ը backend-ին"""
-        service_config = self.config.SERVICES[service_name]
-        url = f"{service_config['url']}{path}"
-        
-        headers = {k: v for k, v in headers.items() 
-                  if k.lower() not in ['host', 'connection', 'transfer-encoding']}
+        headers = [(k, v) for k, v in headers if k not in HOP_BY_HOP_HEADERS]
         
         try:
-            response = await self.http_client.request(
+            response = await self.clients[service_name].request(
                 method=method,
-                url=url,
+                url=path,
                 headers=headers,
                 content=body,
-                params=params,
-                timeout=service_config['timeout']
+                params=query
             )
             
-            self.record_success(service_name)
+            self.record_success(service_name, probe_generation)
             return response
             
         except httpx.TimeoutException:
-            self.record_failure(service_name)
+            self.record_failure(service_name, probe_generation)
             raise HTTPException(status_code=504, detail=f"Gateway timeout: {service_name}")
         except httpx.ConnectError:
-            self.record_failure(service_name)
+            self.record_failure(service_name, probe_generation)
             raise HTTPException(status_code=503, detail=f"Service unavailable: {service_name}")
         except Exception as e:
-            self.record_failure(service_name)
-            logger.error(f"Error forwarding to {service_name}: {str(e)}")
+            self.record_failure(service_name, probe_generation)
+            logger.error("Error forwarding to %s: %s", service_name, e)
             raise HTTPException(status_code=502, detail=f"Bad gateway: {str(e)}")
+        except BaseException:
+            # CancelledError-ը (client disconnect) չպետք է probe-ի տեղը ընդմիշտ զբաղեցնի
+            self.release_probe(service_name, probe_generation)
+            raise
+    
+    async def probe_health(self, service_name: str):
+        """Ստուգել OPEN circuit-ով ծառայության health endpoint-ը"""
+        health_path = self.config.SERVICES[service_name]['health_path']
+        
+        try:
+            response = await self.clients[service_name].get(health_path)
+        except Exception as e:
+            logger.info("Health check failed for %s: %s", service_name, e)
+            return
+        
+        cb_state = self.storage.get_circuit_breaker_state(service_name)
+        if response.status_code == 200 and cb_state.state == 'open':
+            # Ծառայությունը վերականգնվել է, probe-երը թողնել օգտատերերի request-ներին
+            self._enter_half_open(cb_state)
+            logger.info("Circuit breaker for %s: OPEN -> HALF-OPEN (health check)", service_name)
+    
+    async def health_loop(self, interval: float = 5.0):
+        """Background task, որը պարբերաբար ստուգում է OPEN ծառայությունները"""
+        while True:
+            await asyncio.sleep(interval)
+            open_services = [
+                service_name
+                for service_name, cb_state in self.storage.circuit_breakers.items()
+                if cb_state.state == 'open'
+            ]
+            await asyncio.gather(*(self.probe_health(name) for name in open_services))
     
     async def close(self):
-        """Փակել HTTP client-ը"""
-        await self.http_client.aclose()
+        """Փակել HTTP client-ները"""
+        await asyncio.gather(*(client.aclose() for client in self.clients.values()))
         logger.info("Gateway closed")
 
 
@@ -259,15 +450,23 @@ gateway = APIGateway(GatewayConfig(), storage)
 async def lifespan(app: FastAPI):
     """Application lifecycle"""
     logger.info("Gateway starting...")
-    yield
-    logger.info("Gateway shutting down...")
+    async with asyncio.TaskGroup() as background:
+        tasks = [
+            background.create_task(storage.sweep_expired()),
+            background.create_task(gateway.health_loop())
+        ]
+        yield
+        logger.info("Gateway shutting down...")
+        for task in tasks:
+            task.cancel()
     await gateway.close()
 
 
 app = FastAPI(
     title="API Gateway",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -288,13 +487,14 @@ async def get_user_id(request: Request) -> str:
 @app.middleware("http")
 async def gateway_middleware(request: Request, call_next):
     """Գլխավոր middleware"""
-    start_time = time.time()
-    request_id = f"req-{int(start_time * 1000)}"
+    # Monotonic ժամանակը մեկ անգամ՝ բոլոր TTL/window/cooldown հաշվարկների համար
+    start_time = time.monotonic()
+    request_id = f"req-{next(_request_counter):x}"
     
     # Logging
-    logger.info(f"[{request_id}] {request.method} {request.url.path}")
+    logger.info("[%s] %s %s", request_id, request.method, request.url.path)
     
-    storage.stats['total_requests'] += 1
+    storage.total_requests += 1
     
     try:
         # Եթե սա Gateway endpoint է, թույլ տալ
@@ -304,9 +504,9 @@ async def gateway_middleware(request: Request, call_next):
         service_name = gateway.find_service(request.url.path)
         
         if not service_name:
-            logger.warning(f"[{request_id}] Route not found: {request.url.path}")
-            duration = time.time() - start_time
-            return JSONResponse(
+            logger.warning("[%s] Route not found: %s", request_id, request.url.path)
+            duration = time.monotonic() - start_time
+            return ORJSONResponse(
                 status_code=404,
                 content={"error": "Route not found", "path": request.url.path},
                 headers={
@@ -319,14 +519,12 @@ async def gateway_middleware(request: Request, call_next):
         user_id = request.headers.get('X-User-ID', 'anonymous')
         tier = request.headers.get('X-User-Tier', 'default')
         
-        if not gateway.check_rate_limit(user_id, tier):
-            duration = time.time() - start_time
-            return JSONResponse(
+        if not gateway.check_rate_limit(user_id, start_time, tier):
+            duration = time.monotonic() - start_time
+            return Response(
+                content=RATE_LIMITED_BODY,
                 status_code=429,
-                content={
-                    "error": "Rate limit exceeded",
-                    "retry_after": 60
-                },
+                media_type="application/json",
                 headers={
                     "X-Request-ID": request_id,
                     "X-Response-Time": f"{duration:.3f}s",
@@ -334,31 +532,28 @@ async def gateway_middleware(request: Request, call_next):
                 }
             )
 
-        if not gateway.check_circuit_breaker(service_name):
-            duration = time.time() - start_time
-            return JSONResponse(
-                status_code=503,
-                content={
-                    "error": "Service temporarily unavailable",
-                    "service": service_name
-                },
-                headers={
-                    "X-Request-ID": request_id,
-                    "X-Response-Time": f"{duration:.3f}s",
-                    "X-Service": service_name
-                }
-            )
-        
+        cache_key = None
         if request.method == "GET":
-            cache_key = f"{request.url.path}?{request.url.query}"
-            cached_response = storage.cache_get(cache_key)
-
-            if cached_response:
-                storage.stats['cached_requests'] += 1
-                duration = time.time() - start_time
-                logger.info(f"[{request_id}] Cache HIT")
-                return JSONResponse(
-                    content=cached_response,
+            # Query param-երը սորտավորված են, որպեսզի ?a=1&b=2 և ?b=2&a=1 ունենան նույն key-ը,
+            # իսկ tier-ը և Authorization-ը key-ում են, որպեսզի պատասխանը չհասնի այլ օգտատիրոջ
+            cache_key = (
+                f"{request.url.path}?{urlencode(sorted(request.query_params.multi_items()))}"
+                f"|{tier}|{request.headers.get('Authorization', '')}"
+            )
+            cached_response = storage.cache_get(cache_key, start_time)
+            
+            if cached_response is None and cache_key in storage.inflight:
+                # Նույն key-ով request արդեն գնացել է backend, սպասել դրա արդյունքին
+                cached_response = await asyncio.shield(storage.inflight[cache_key])
+
+            if cached_response is not None:
+                storage.cached_requests += 1
+                duration = time.monotonic() - start_time
+                logger.info("[%s] Cache HIT", request_id)
+                cached_body, content_type = cached_response
+                return Response(
+                    content=cached_body,
+                    media_type=content_type,
                     headers={
                         "X-Cache": "HIT",
                         "X-Request-ID": request_id,
@@ -367,28 +562,59 @@ async def gateway_middleware(request: Request, call_next):
                     }
                 )
         
-        # Forward request
         body = await request.body()
         
-        response = await gateway.forward_request(
-            service_name=service_name,
-            path=request.url.path,
-            method=request.method,
-            headers=dict(request.headers),
-            body=body if body else None,
-            params=dict(request.query_params)
-        )
+        # Circuit breaker-ը ստուգել վերջում, որպեսզի half-open probe-ը միշտ հասնի forward_request-ին
+        allowed, probe_generation = gateway.check_circuit_breaker(service_name, start_time)
+        if not allowed:
+            duration = time.monotonic() - start_time
+            return Response(
+                content=SERVICE_UNAVAILABLE_BODIES[service_name],
+                status_code=503,
+                media_type="application/json",
+                headers={
+                    "X-Request-ID": request_id,
+                    "X-Response-Time": f"{duration:.3f}s",
+                    "X-Service": service_name
+                }
+            )
+        
+        leader = None
+        if cache_key is not None and cache_key not in storage.inflight:
+            leader = storage.inflight[cache_key] = asyncio.get_running_loop().create_future()
         
-        if request.method == "GET" and response.status_code == 200:
-            cache_key = f"{request.url.path}?{request.url.query}"
-            storage.cache_set(cache_key, response.json(), ttl=300)
+        cached_response = None
+        try:
+            # Forward request
+            response = await gateway.forward_request(
+                service_name=service_name,
+                path=request.url.path,
+                method=request.method,
+                headers=request.headers.raw,
+                body=body if body else None,
+                query=request.url.query or None,
+                probe_generation=probe_generation
+            )
+            
+            content_type = response.headers.get('content-type', 'application/json')
+            
+            if cache_key is not None and response.status_code == 200:
+                cached_response = (response.content, content_type)
+                storage.cache_set(cache_key, cached_response, start_time, ttl=300)
+        finally:
+            if leader is not None:
+                # None-ը նշանակում է, որ սպասողները պետք է իրենք գնան backend
+                del storage.inflight[cache_key]
+                leader.set_result(cached_response)
         
-        duration = time.time() - start_time
-        logger.info(f"[{request_id}] {response.status_code} - {duration:.3f}s")
+        duration = time.monotonic() - start_time
+        logger.info("[%s] %s - %.3fs", request_id, response.status_code, duration)
         
-        return JSONResponse(
+        # Backend-ի body-ն փոխանցել առանց JSON parse/serialize
+        return Response(
+            content=response.content,
             status_code=response.status_code,
-            content=response.json() if response.content else None,
+            media_type=content_type,
             headers={
                 "X-Request-ID": request_id,
                 "X-Response-Time": f"{duration:.3f}s",
@@ -398,9 +624,9 @@ async def gateway_middleware(request: Request, call_next):
         )
     
     except HTTPException as e:
-        duration = time.time() - start_time
-        logger.error(f"[{request_id}] {e.status_code} - {e.detail}")
-        return JSONResponse(
+        duration = time.monotonic() - start_time
+        logger.error("[%s] %s - %s", request_id, e.status_code, e.detail)
+        return ORJSONResponse(
             status_code=e.status_code,
             content={"error": e.detail, "request_id": request_id},
             headers={
@@ -411,9 +637,9 @@ async def gateway_middleware(request: Request, call_next):
         )
 
     except Exception as e:
-        duration = time.time() - start_time
-        logger.error(f"[{request_id}] Unexpected error: {str(e)}")
-        return JSONResponse(
+        duration = time.monotonic() - start_time
+        logger.error("[%s] Unexpected error: %s", request_id, e)
+        return ORJSONResponse(
             status_code=500,
             content={"error": "Internal server error", "request_id": request_id},
             headers={
@@ -440,12 +666,13 @@ async def get_metrics():
     return {
         "stats": storage.stats,
         "rate_limits": {
-            k: v for k, v in storage.rate_limits.items()
+            k: {'previous': v[0], 'current': v[1], 'window_start': v[2]}
+            for k, v in storage.rate_limits.items()
         },
         "circuit_breakers": {
             k: {
-                'state': v['state'],
-                'failures': v['failures']
+                'state': v.state,
+                'failures': v.failures
             }
             for k, v in storage.circuit_breakers.items()
         },
@@ -481,9 +708,14 @@ if __name__ == "__main__":
     ╚════════════════════════════════════════╝
     """)
     
+    # loop/http "auto"-ն ընտրում է uvloop-ը և httptools-ը, եթե տեղադրված են (uvicorn[standard]),
+    # access log-ն անջատված է, քանի որ middleware-ն արդեն log է անում ամեն request
     uvicorn.run(
         app,
         host="0.0.0.0",
         port=8000,
-        log_level="info"
+        log_level="info",
+        loop="auto",
+        http="auto",
+        access_log=False
     )
\ No newline at end of file
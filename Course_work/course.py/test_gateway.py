@@ -1,37 +1,155 @@
 import asyncio
 import httpx
+import orjson
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+from contextvars import ContextVar
 import sys
 
 
+# Ընթացիկ թեստի output buffer-ը (ամեն asyncio task-ի համար առանձին)
+_output: ContextVar[Optional[List[str]]] = ContextVar("_output", default=None)
+
+# Header-ներ, որոնք gateway-ը պետք է ավելացնի ամեն պատասխանի
+REQUIRED_HEADERS = ("X-Request-ID", "X-Response-Time", "X-Service")
+
+# print_result-ի նշանը՝ ինդեքսավորված bool-ով
+RESULT_ICONS = ("Failed", "Passed")
+
+# Որքան ժամանակ է /metrics-ի պատասխանը համարվում թարմ թեստերի միջև կիսելու համար
+METRICS_TTL = 1.0
+
+# Process-ի ընդհանուր client-ները (մեկը ամեն gateway URL-ի համար),
+# որպեսզի բոլոր GatewayTester-ները կիսեն keep-alive pool-ը
+_clients: Dict[str, httpx.AsyncClient] = {}
+# Քանի GatewayTester է օգտագործում ամեն ընդհանուր client-ը
+_client_refs: Dict[str, int] = {}
+
+
+def get_client(base_url: str) -> httpx.AsyncClient:
+    """Վերադարձնել base_url-ի ընդհանուր AsyncClient-ը՝ ստեղծելով առաջին կանչի ժամանակ
+
+    Ամեն կանչ ավելացնում է client-ի reference-ների քանակը, release_client-ը՝ նվազեցնում։
+    """
+    client = _clients.get(base_url)
+    if client is None or client.is_closed:
+        # Pool-ը բավական մեծ է rate-limit թեստի զուգահեռ burst-ի համար
+        client = _clients[base_url] = httpx.AsyncClient(
+            base_url=base_url,
+            # Ֆունկցիոնալ թեստերին 30s պետք չէ, burst-ը սահմանափակված է առանձին deadline-ով
+            timeout=httpx.Timeout(5.0, connect=2.0),
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=200,
+                max_keepalive_connections=100,
+                keepalive_expiry=30.0
+            )
+        )
+        _client_refs[base_url] = 0
+    _client_refs[base_url] += 1
+    return client
+
+
+async def release_client(base_url: str):
+    """Նվազեցնել reference-ների քանակը և փակել client-ը, երբ այն այլևս ոչ ոք չի օգտագործում"""
+    refs = _client_refs.get(base_url, 0) - 1
+    if refs > 0:
+        _client_refs[base_url] = refs
+        return
+    _client_refs.pop(base_url, None)
+    client = _clients.pop(base_url, None)
+    if client is not None:
+        await client.aclose()
+
+
 class GatewayTester:
-    def __init__(self, gateway_url: str = "http://localhost:8000"):
+    def __init__(
+        self,
+        gateway_url: str = "http://localhost:8000",
+        client: Optional[httpx.AsyncClient] = None
+    ):
         self.gateway_url = gateway_url
-        self.client = httpx.AsyncClient(timeout=30.0)
-        self.results: List[Dict] = []
+        # Դրսից տրված client-ը փակում է այն տվողը, ընդհանուրը՝ վերջին release_client-ը
+        self._shared_ref = client is None
+        self.client = client if client is not None else get_client(gateway_url)
+        # Արդյունքները երկու զուգահեռ list-ում՝ ամեն արդյունքի համար dict չստեղծելու համար
+        self._ok: List[bool] = []
+        self._msg: List[str] = []
+        # /metrics request-ը, որը կիսում են test_metrics-ը և test_circuit_breaker-ը
+        self._metrics: Optional[asyncio.Task] = None
+        self._metrics_at = 0.0
+    
+    @property
+    def results(self) -> List[Dict]:
+        """Արդյունքները dict-երի տեսքով"""
+        return [
+            {"success": ok, "message": msg}
+            for ok, msg in zip(self._ok, self._msg)
+        ]
+    
+    def emit(self, line: str):
+        """Ավելացնել տողը թեստի buffer-ին կամ տպել անմիջապես"""
+        buffer = _output.get()
+        if buffer is None:
+            print(line)
+        else:
+            buffer.append(line)
+    
+    async def run_test(self, test):
+        """Գործարկել թեստը և տպել նրա output-ը մեկ write-ով"""
+        buffer: List[str] = []
+        token = _output.set(buffer)
+        try:
+            await test()
+        finally:
+            _output.reset(token)
+            sys.stdout.write("\n".join(buffer) + "\n")
+    
+    async def fetch_status(self, request: httpx.Request) -> int:
+        """Ուղարկել request-ը և վերադարձնել միայն status code-ը՝ body-ն չպահելով"""
+        response = await self.client.send(request, stream=True)
+        try:
+            # Body-ն կարդալ մինչև վերջ, որպեսզի connection-ը վերադառնա pool
+            async for _ in response.aiter_raw():
+                pass
+        finally:
+            await response.aclose()
+        return response.status_code
+    
+    async def fetch_metrics(self) -> Tuple[int, Optional[Dict]]:
+        """GET /metrics, պատասխանը կիսվում է METRICS_TTL-ի ընթացքում"""
+        now = time.monotonic()
+        if self._metrics is None or now - self._metrics_at > METRICS_TTL:
+            self._metrics = asyncio.create_task(self._load_metrics())
+            self._metrics_at = now
+        # Զուգահեռ թեստերը սպասում են նույն task-ին, ուստի request-ը գնում է մեկ անգամ
+        return await asyncio.shield(self._metrics)
+    
+    async def _load_metrics(self) -> Tuple[int, Optional[Dict]]:
+        """Ստանալ և parse անել /metrics-ը"""
+        response = await self.client.get("/metrics")
+        data = orjson.loads(response.content) if response.status_code == 200 else None
+        return response.status_code, data
     
     def print_test(self, name: str):
         """Print test անունը"""
-        print(f"\n{'='*60}")
-        print(f"TEST: {name}")
-        print(f"{'='*60}")
+        self.emit(f"\n{'='*60}\nTEST: {name}\n{'='*60}")
     
     def print_result(self, success: bool, message: str):
         """Print test-ի արդյունքը"""
-        icon = "Passed" if success else "Failed"
-        print(f"{icon} {message}")
-        self.results.append({"success": success, "message": message})
+        self.emit(f"{RESULT_ICONS[success]} {message}")
+        self._ok.append(success)
+        self._msg.append(message)
     
     async def test_health_check(self):
         """Թեստ 1: Health Check"""
         self.print_test("Health Check")
         
         try:
-            response = await self.client.get(f"{self.gateway_url}/health")
+            response = await self.client.get("/health")
             
             if response.status_code == 200:
-                data = response.json()
+                data = orjson.loads(response.content)
                 self.print_result(True, f"Gateway is healthy: {data}")
             else:
                 self.print_result(False, f"Unexpected status: {response.status_code}")
@@ -44,13 +162,12 @@ class GatewayTester:
         self.print_test("Metrics Endpoint")
         
         try:
-            response = await self.client.get(f"{self.gateway_url}/metrics")
+            status_code, data = await self.fetch_metrics()
             
-            if response.status_code == 200:
-                data = response.json()
+            if status_code == 200:
                 self.print_result(True, f"Metrics retrieved: {data.get('stats', {})}")
             else:
-                self.print_result(False, f"Unexpected status: {response.status_code}")
+                self.print_result(False, f"Unexpected status: {status_code}")
         
         except Exception as e:
             self.print_result(False, f"Metrics failed: {str(e)}")
@@ -65,22 +182,27 @@ class GatewayTester:
             "/api/orders"
         ]
         
-        for endpoint in endpoints:
-            try:
-                response = await self.client.get(
-                    f"{self.gateway_url}{endpoint}",
-                    headers={"X-User-ID": "test-user"}
+        headers = {"X-User-ID": "test-user"}
+        
+        statuses = await asyncio.gather(
+            *(
+                self.fetch_status(
+                    self.client.build_request("GET", endpoint, headers=headers)
                 )
-                
-                if response.status_code == 200:
-                    self.print_result(True, f"{endpoint} → {response.status_code}")
-                elif response.status_code == 503:
-                    self.print_result(True, f"{endpoint} → Service unavailable (expected without backends)")
-                else:
-                    self.print_result(False, f"{endpoint} → {response.status_code}")
-            
-            except Exception as e:
-                self.print_result(False, f"{endpoint} failed: {str(e)}")
+                for endpoint in endpoints
+            ),
+            return_exceptions=True
+        )
+        
+        for endpoint, status in zip(endpoints, statuses):
+            if isinstance(status, Exception):
+                self.print_result(False, f"{endpoint} failed: {str(status)}")
+            elif status == 200:
+                self.print_result(True, f"{endpoint} → {status}")
+            elif status == 503:
+                self.print_result(True, f"{endpoint} → Service unavailable (expected without backends)")
+            else:
+                self.print_result(False, f"{endpoint} → {status}")
     
     async def test_rate_limiting(self):
         """Թեստ 4: Rate Limiting"""
@@ -90,28 +212,54 @@ class GatewayTester:
         endpoint = "/api/users"
         limit = 50  # Limit for anonymous tier
 
-        print(f"Sending {limit + 10} requests to test rate limit...")
+        # Warm-up՝ connection-ը բացվում է burst-ից առաջ, /health-ը rate limit չի ծախսում
+        try:
+            await self.client.get("/health")
+        except httpx.HTTPError:
+            pass
+
+        self.emit(f"Sending {limit + 10} requests to test rate limit...")
+
+        # Request-ը կառուցվում է մեկ անգամ (URL parse, header merge) և ուղարկվում բազմիցս
+        request = self.client.build_request(
+            "GET",
+            endpoint,
+            headers={
+                "X-User-ID": user_id,
+                "X-User-Tier": "anonymous"
+            }
+        )
+
+        # Միաժամանակ ընթացող request-ների քանակը սահմանափակված է
+        semaphore = asyncio.Semaphore(32)
+
+        async def send_one():
+            async with semaphore:
+                return await self.fetch_status(request)
+
+        tasks = [asyncio.create_task(send_one()) for _ in range(limit + 10)]
+
+        # Ամբողջ burst-ի համար ընդհանուր deadline, ոչ թե ամեն request-ի համար առանձին
+        try:
+            async with asyncio.timeout(10):
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except TimeoutError:
+            self.emit("Rate limit probe hit the 10s deadline, counting partial results")
 
         success_count = 0
         rate_limited_count = 0
+        errored_count = 0
 
-        for i in range(limit + 10):
-            try:
-                response = await self.client.get(
-                    f"{self.gateway_url}{endpoint}",
-                    headers={
-                        "X-User-ID": user_id,
-                        "X-User-Tier": "anonymous"  
-                    }
-                )
-
-                if response.status_code == 429:
-                    rate_limited_count += 1
-                else:
-                    success_count += 1
+        for task in tasks:
+            if task.cancelled() or task.exception() is not None:
+                errored_count += 1
+            elif task.result() == 429:
+                rate_limited_count += 1
+            else:
+                success_count += 1
 
-            except Exception as e:
-                pass
+        if errored_count:
+            self.emit(f"{errored_count} requests failed or timed out")
 
         if rate_limited_count > 0:
             self.print_result(
@@ -133,7 +281,7 @@ class GatewayTester:
 
         try:
             response1 = await self.client.get(
-                f"{self.gateway_url}{endpoint}",
+                endpoint,
                 headers={"X-User-ID": "cache-test"}
             )
 
@@ -150,7 +298,7 @@ class GatewayTester:
             await asyncio.sleep(0.1)
 
             response2 = await self.client.get(
-                f"{self.gateway_url}{endpoint}",
+                endpoint,
                 headers={"X-User-ID": "cache-test"}
             )
             cache_header2 = response2.headers.get("X-Cache", "MISS")
@@ -172,10 +320,9 @@ class GatewayTester:
         
         
         try:
-            response = await self.client.get(f"{self.gateway_url}/metrics")
-            data = response.json()
+            _, data = await self.fetch_metrics()
             
-            if "circuit_breakers" in data:
+            if data is not None and "circuit_breakers" in data:
                 cb_states = data["circuit_breakers"]
                 self.print_result(
                     True,
@@ -194,7 +341,7 @@ class GatewayTester:
         # Test 404 - route not found
         try:
             response = await self.client.get(
-                f"{self.gateway_url}/api/nonexistent",
+                "/api/nonexistent",
                 headers={"X-User-ID": "test"}
             )
             
@@ -212,25 +359,43 @@ class GatewayTester:
         
         try:
             response = await self.client.get(
-                f"{self.gateway_url}/api/users",
+                "/api/users",
                 headers={"X-User-ID": "header-test"}
             )
             
-            required_headers = ["X-Request-ID", "X-Response-Time", "X-Service"]
-            missing_headers = []
-            
-            for header in required_headers:
-                if header not in response.headers:
-                    missing_headers.append(header)
+            present = {header.lower() for header in response.headers.keys()}
+            missing_headers = [
+                header for header in REQUIRED_HEADERS
+                if header.lower() not in present
+            ]
             
             if not missing_headers:
-                self.print_result(True, f"All custom headers present: {required_headers}")
+                self.print_result(True, f"All custom headers present: {list(REQUIRED_HEADERS)}")
             else:
                 self.print_result(False, f"Missing headers: {missing_headers}")
         
         except Exception as e:
             self.print_result(False, f"Headers test failed: {str(e)}")
     
+    async def test_shared_client(self):
+        """Թեստ 9: Shared Client"""
+        self.print_test("Shared Client")
+        
+        try:
+            sibling = GatewayTester(self.gateway_url)
+            await sibling.close()
+            
+            # Sibling-ի close-ը չպետք է փակի այս tester-ի client-ը
+            response = await self.client.get("/health")
+            
+            if response.status_code == 200:
+                self.print_result(True, "Client still usable after closing a sibling tester")
+            else:
+                self.print_result(False, f"Unexpected status: {response.status_code}")
+        
+        except Exception as e:
+            self.print_result(False, f"Shared client test failed: {str(e)}")
+    
     async def run_all_tests(self):
         """Գործարկել բոլոր թեստերը"""
         print(f"\n{'#'*60}")
@@ -238,49 +403,63 @@ class GatewayTester:
         print(f"# Target: {self.gateway_url}")
         print(f"{'#'*60}")
         
-        tests = [
+        # Այս թեստերը state չեն փոխում և կարող են աշխատել զուգահեռ
+        independent_tests = [
             self.test_health_check,
             self.test_metrics,
             self.test_routing,
-            self.test_caching,
             self.test_circuit_breaker,
             self.test_error_handling,
             self.test_headers,
-            self.test_rate_limiting,  
+            self.test_shared_client,
         ]
         
-        for test in tests:
-            await test()
-            await asyncio.sleep(0.5)  
+        # Cache-ը և rate limiter-ը փոխում են gateway-ի state-ը, դրանք՝ հերթով
+        stateful_tests = [
+            self.test_caching,
+            self.test_rate_limiting,
+        ]
+        
+        await asyncio.gather(*(self.run_test(test) for test in independent_tests))
+        
+        for test in stateful_tests:
+            await self.run_test(test)
         
         self.print_summary()
     
     def print_summary(self):
         """Print test-երի ամփոփումը"""
-        print(f"\n{'='*60}")
-        print(f"TEST SUMMARY")
-        print(f"{'='*60}")
-        
-        total = len(self.results)
-        passed = sum(1 for r in self.results if r["success"])
+        total = len(self._ok)
+        passed = sum(self._ok)
         failed = total - passed
         
-        print(f"Total Tests: {total}")
-        print(f"Passed: {passed}")
-        print(f"Failed: {failed}")
-        print(f"Success Rate: {(passed/total*100):.1f}%")
+        lines = [
+            f"\n{'='*60}",
+            f"TEST SUMMARY",
+            f"{'='*60}",
+            f"Total Tests: {total}",
+            f"Passed: {passed}",
+            f"Failed: {failed}",
+            f"Success Rate: {(passed/total*100):.1f}%",
+        ]
         
         if failed > 0:
-            print(f"\n Failed Tests:")
-            for result in self.results:
-                if not result["success"]:
-                    print(f"  - {result['message']}")
+            lines.append(f"\n Failed Tests:")
+            lines.extend(
+                f"  - {message}"
+                for ok, message in zip(self._ok, self._msg)
+                if not ok
+            )
         
-        print(f"\n{'='*60}\n")
+        lines.append(f"\n{'='*60}\n")
+        sys.stdout.write("\n".join(lines) + "\n")
     
     async def close(self):
-        """Փակել HTTP client-ը"""
-        await self.client.aclose()
+        """Ազատել ընդհանուր HTTP client-ը, այն փակվում է վերջին tester-ի հետ"""
+        if not self._shared_ref:
+            return
+        self._shared_ref = False
+        await release_client(self.gateway_url)
 
 
 async def main():
@@ -307,7 +486,15 @@ async def main():
 
 
 if __name__ == "__main__":
+    # uvloop-ը արագացնում է event loop-ը, բայց հասանելի չէ Windows-ում
+    try:
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+    
     try:
-        asyncio.run(main())
+        with asyncio.Runner(loop_factory=loop_factory) as runner:
+            runner.run(main())
     except KeyboardInterrupt:
         print("\n\nBye!")
\ No newline at end of file